@@ -1,11 +1,17 @@
 """Fetch.ai uAgent that manages Notion notes via natural language."""
 
-import json
+import asyncio
+import hashlib
 import os
-import requests
+import re
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
 from datetime import datetime, timezone
 from uuid import uuid4
 
+import httpx
+import orjson
 from dotenv import load_dotenv
 
 from uagents import Agent, Context, Protocol
@@ -21,6 +27,7 @@ from uagents_core.utils.registration import (
     RegistrationRequestCredentials,
 )
 
+from .intent_cache import SemanticIntentCache
 from .notion_client_wrapper import NotionNotes
 
 load_dotenv()
@@ -35,10 +42,15 @@ AGENTVERSE_KEY = os.getenv("ILABS_AGENTVERSE_API_KEY")
 ASI1_URL = "https://api.asi1.ai/v1/chat/completions"
 
 def _asi1_headers() -> dict:
-    return {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('ASI_ONE_API_KEY')}",
-    }
+    return {"Authorization": f"Bearer {os.getenv('ASI_ONE_API_KEY')}"}
+
+# Single shared client for every ASI:1 call: keeps the TCP/TLS connection alive
+# between chat turns and doesn't block the event loop
+_asi1_client = httpx.AsyncClient(
+    timeout=30,
+    headers={"Content-Type": "application/json"},
+    limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=120),
+)
 
 # Notion client – initialised lazily after env vars are loaded
 notion: NotionNotes | None = None
@@ -55,56 +67,181 @@ agent = Agent(
 protocol = Protocol(spec=chat_protocol_spec)
 
 
+# Kept constant and compact so the provider can reuse the cached prompt prefix
+# across turns; only the user message varies between requests.
 SYSTEM_PROMPT = """\
 You are an intent classifier for a Notion notes assistant.
-Given the user message, respond ONLY with valid JSON (no markdown fences).
-
-Possible intents:
-- connect_notion   : user wants to test or verify the Notion connection
-- search_notes     : user wants to find notes by keyword
-- list_notes       : user wants to see recent/latest notes
-- read_note        : user wants to read the content of a specific note (by title)
-- create_note      : user wants to create a new note/page
-- append_note      : user wants to add text to an existing note
-- add_todo         : user wants to add a to-do/task item to a note
-- archive_note     : user wants to archive/delete a note
-- general_query    : anything else / general question
-
-For search_notes, extract: query (search keyword string), limit (int, default 5).
-For list_notes, extract: limit (int, default 5).
-For read_note, extract: title (the note title to look up).
-For create_note, extract: title (new page title), content (optional body text, default "").
-For append_note, extract: title (existing note title), text (the text to append).
-For add_todo, extract: title (existing note title to add the task to), task (the to-do item text).
-For archive_note, extract: title (the note title to archive).
-
-Response format:
-{"intent": "<intent>", "params": {<extracted params or empty dict>}}
+Reply ONLY with JSON (no markdown): {"intent": "<intent>", "params": {...}}
+
+Intents and their params:
+connect_notion: test the Notion connection | {}
+search_notes: find notes by keyword | {query: str, limit: int = 5}
+list_notes: recent/latest notes | {limit: int = 5}
+read_note: read a note's content | {title: str}
+create_note: create a new note/page | {title: str, content: str = ""}
+append_note: add text to an existing note | {title: str, text: str}
+add_todo: add a to-do/task to a note | {title: str, task: str}
+archive_note: archive/delete a note | {title: str}
+general_query: anything else | {}
 """
 
+# Built once and reused for every request
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+_GENERAL_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a helpful Notion notes assistant. Answer the user's question concisely.",
+}
+
+# Bump whenever SYSTEM_PROMPT changes so stale cached intents are ignored
+SYSTEM_PROMPT_VERSION = "2"
+
+# ---------------------------------------------------------------------------
+# Intent cache – exact match on normalised user text (LRU)
+# ---------------------------------------------------------------------------
+INTENT_CACHE_SIZE = 1024
+
+_intent_cache: OrderedDict[str, dict] = OrderedDict()
+_intent_cache_lock = threading.Lock()
+
+
+def _intent_cache_key(user_text: str) -> str:
+    normalized = " ".join(user_text.lower().split())
+    return hashlib.sha256(f"{SYSTEM_PROMPT_VERSION}|asi1|{normalized}".encode()).hexdigest()
+
+
+def _intent_cache_get(key: str) -> dict | None:
+    with _intent_cache_lock:
+        result = _intent_cache.get(key)
+        if result is not None:
+            _intent_cache.move_to_end(key)
+        return result
+
+
+def _intent_cache_put(key: str, result: dict) -> None:
+    with _intent_cache_lock:
+        _intent_cache[key] = result
+        _intent_cache.move_to_end(key)
+        while len(_intent_cache) > INTENT_CACHE_SIZE:
+            _intent_cache.popitem(last=False)
+
+
+# Second-chance layer: paraphrases of earlier messages ("list my recent pages"
+# vs "show latest notes") are matched by embedding similarity.
+semantic_intent_cache = SemanticIntentCache(
+    path=os.getenv("INTENT_CACHE_PATH", "intent_cache.npz"),
+    version=SYSTEM_PROMPT_VERSION,
+)
+
+# Only intents whose params are all defaults may be reused for a *similar* message;
+# titles, tasks and queries are specific to the exact text they came from.
+_SEMANTIC_CACHEABLE_INTENTS = {
+    "connect_notion": {},
+    "list_notes": {"limit": 5},
+}
+
+
+def _param_free(result: dict) -> dict | None:
+    """Return result with params stripped if they are all defaults, else None."""
+    intent = result.get("intent")
+    defaults = _SEMANTIC_CACHEABLE_INTENTS.get(intent)
+    params = result.get("params") or {}
+    if defaults is None or not isinstance(params, dict):
+        return None
+    if any(k not in defaults or str(v) != str(defaults[k]) for k, v in params.items()):
+        return None
+    return {"intent": intent, "params": {}}
+
 
-def classify_intent(user_text: str) -> dict:
-    """Send the user message to ASI:1 and parse the JSON intent."""
+# ---------------------------------------------------------------------------
+# Rule-based fast path – unambiguous, read-only commands skip the LLM entirely.
+# Destructive intents (archive) always go through ASI:1.
+# ---------------------------------------------------------------------------
+_LIST_RE = re.compile(
+    r"^(?:list|show|what are)(?: me)? (?:my )?(?:(?:recent|latest) )?(?:(\d+) )?(?:notes|pages)(?: (\d+))?$",
+    re.I,
+)
+# Only messages that explicitly say they are about notes/pages qualify; filler such
+# as "my notes about" is kept out of the capture so it doesn't dilute the query
+_SEARCH_RE = re.compile(
+    r"^(?:search|find)(?: for| in| through)? (?:my )?(?:notes|pages)"
+    r"(?: for| about| on| mentioning| with)? (.+)$",
+    re.I,
+)
+_READ_RE = re.compile(r"^read (?:my |the )?(?:note|page) (?:titled |called |named )?(.+)$", re.I)
+# Captures with these words are likely multi-clause or not about a note at all
+# ("find out what ...", "read X and summarize it") and are left to the LLM
+_AMBIGUOUS_RE = re.compile(
+    r"\b(?:and|then|or|but|also|everything|all|every|any|out|what|how|why|who|when|where)\b",
+    re.I,
+)
+
+
+def _fast_classify(text: str) -> dict | None:
+    """Classify simple commands with regexes. Returns None when the LLM is needed."""
+    text = " ".join(text.split()).rstrip(".!?")
+    m = _LIST_RE.match(text)
+    if m:
+        limit = m.group(1) or m.group(2)
+        return {"intent": "list_notes", "params": {"limit": int(limit)} if limit else {}}
+    m = _SEARCH_RE.match(text)
+    if m and not _AMBIGUOUS_RE.search(m.group(1)):
+        return {"intent": "search_notes", "params": {"query": m.group(1).strip("\"'")}}
+    m = _READ_RE.match(text)
+    if m and not _AMBIGUOUS_RE.search(m.group(1)):
+        return {"intent": "read_note", "params": {"title": m.group(1).strip("\"'")}}
+    return None
+
+
+async def _asi1_classify(user_text: str) -> dict | None:
+    """Ask ASI:1 for the intent. Returns None if the call or JSON parsing fails."""
     try:
-        r = requests.post(
+        r = await _asi1_client.post(
             ASI1_URL,
             headers=_asi1_headers(),
-            json={
+            content=orjson.dumps({
                 "model": "asi1",
-                "messages": [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": user_text},
-                ],
+                "messages": [_SYSTEM_MSG, {"role": "user", "content": user_text}],
                 "max_tokens": 256,
-            },
+            }),
         )
-        raw = r.json()["choices"][0]["message"]["content"].strip()
+        raw = orjson.loads(r.content)["choices"][0]["message"]["content"].strip()
         # Strip markdown fences if the model adds them
         if raw.startswith("```"):
             raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-        return json.loads(raw)
+        return orjson.loads(raw)
     except Exception:
+        return None
+
+
+async def classify_intent(user_text: str) -> dict:
+    """Send the user message to ASI:1 and parse the JSON intent.
+
+    Repeated phrases are answered from the exact-match cache without a network call;
+    paraphrases of parameter-free requests are answered from the semantic cache.
+    """
+    key = _intent_cache_key(user_text)
+    cached = _intent_cache_get(key)
+    if cached is not None:
+        return cached
+    # Start ASI:1 right away so a semantic-cache miss doesn't pay both round-trips
+    asi1_task = asyncio.create_task(_asi1_classify(user_text))
+    vec = await asyncio.to_thread(semantic_intent_cache.embed, user_text)
+    if vec is not None:
+        cached = semantic_intent_cache.lookup(vec)
+        # Not promoted into the exact-match cache: a near miss is not the same text
+        if cached is not None and _param_free(cached) is not None:
+            asi1_task.cancel()
+            return cached
+    result = await asi1_task
+    if not isinstance(result, dict):
         return {"intent": "general_query", "params": {}}
+    # Only cache real classifications, never the general_query fallback
+    if result.get("intent", "general_query") != "general_query":
+        _intent_cache_put(key, result)
+        semantic_result = _param_free(result)
+        if vec is not None and semantic_result is not None:
+            semantic_intent_cache.add(vec, semantic_result)
+    return result
 
 
 def _ensure_notion() -> str | None:
@@ -119,67 +256,131 @@ def _ensure_notion() -> str | None:
         return f"Notion is not configured: {e}"
 
 
-def handle_connect_notion(ctx: Context) -> str:
+# ---------------------------------------------------------------------------
+# Speculative page prefetch – runs alongside intent classification
+# ---------------------------------------------------------------------------
+_in_flight_fetch: asyncio.Task | None = None
+_prefetched_pages: ContextVar[asyncio.Task | None] = ContextVar("_prefetched_pages", default=None)
+
+
+def _prefetch_pages() -> asyncio.Task | None:
+    """Start fetching the page list, sharing one in-flight fetch between messages."""
+    global _in_flight_fetch
+    if _ensure_notion():
+        return None
+    if _in_flight_fetch is None or _in_flight_fetch.done():
+        _in_flight_fetch = asyncio.create_task(notion._fetch_all_pages())
+        # Intents that don't need pages never await the task; swallow its exception
+        _in_flight_fetch.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return _in_flight_fetch
+
+
+async def _get_prefetched_pages() -> list[dict] | None:
+    """Return the speculatively fetched pages, or None so callers fetch their own."""
+    task = _prefetched_pages.get()
+    if task is None:
+        return None
+    try:
+        return await asyncio.shield(task)
+    except Exception:
+        return None
+
+
+async def _search_notes(query: str, limit: int) -> list[dict]:
+    pages = await _get_prefetched_pages()
+    return await notion.search_notes(query=query, limit=limit, pages=pages)
+
+
+async def _find_note(title: str, destructive: bool = False) -> tuple[dict | None, str | None]:
+    """Look a note up by title. Returns (note, None) or (None, error string).
+
+    Several pages with the same title resolve to the most recently edited one, and
+    when no title matches semantic search is tried. Destructive operations do
+    neither: they only act on a single match and ask the user otherwise.
+    """
+    pages = await _get_prefetched_pages()
+    matches = await notion.find_by_title(title, pages)
+    same_title = len({m["title"].lower() for m in matches}) == 1
+    if len(matches) == 1 or (matches and same_title and not destructive):
+        return matches[0], None
+    if len(matches) > 1:
+        lines = []
+        for n in matches[:5]:
+            edited = n.get("last_edited", "")[:10]
+            line = f"- **{n['title']}**" + (f" (edited {edited})" if edited else "")
+            lines.append(line + (f" {n['url']}" if n.get("url") else ""))
+        return None, (
+            f"Several notes match \"{title}\":\n" + "\n".join(lines)
+            + "\nWhich one did you mean? You can reply with its link."
+        )
+    if not destructive:
+        notes = await notion.search_notes(query=title, limit=1, pages=pages)
+        if notes:
+            return notes[0], None
+    return None, f"Couldn't find a note titled \"{title}\"."
+
+
+async def handle_connect_notion(ctx: Context) -> str:
     err = _ensure_notion()
     if err:
         return err
-    ok = notion.test_connection()
+    ok = await notion.test_connection()
     return "Notion connection successful!" if ok else "Failed to connect to Notion. Check your API key."
 
 
-def handle_search_notes(ctx: Context, params: dict) -> str:
+async def handle_search_notes(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
     query = params.get("query", "")
     limit = int(params.get("limit", 5))
-    notes = notion.search_notes(query=query, limit=limit)
+    notes = await _search_notes(query, limit)
     if not notes:
         return f"No notes found matching \"{query}\"."
     return _format_notes(notes)
 
 
-def handle_list_notes(ctx: Context, params: dict) -> str:
+async def handle_list_notes(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
     limit = int(params.get("limit", 5))
-    notes = notion.list_recent_notes(limit)
+    pages = await _get_prefetched_pages()
+    notes = await notion.list_recent_notes(limit, pages)
     if not notes:
         return "No notes found in your Notion workspace."
     return _format_notes(notes)
 
 
-def handle_read_note(ctx: Context, params: dict) -> str:
+async def handle_read_note(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
     title = params.get("title", "")
-    notes = notion.search_notes(query=title, limit=1)
-    if not notes:
-        return f"Couldn't find a note titled \"{title}\"."
-    note = notes[0]
-    content = notion.get_page_content(note["id"])
+    note, err = await _find_note(title)
+    if err:
+        return err
+    content = await notion.get_page_content(note["id"])
     header = f"**{note['title']}**\n"
     if content:
         return header + content
     return header + "(This page has no text content.)"
 
 
-def handle_create_note(ctx: Context, params: dict) -> str:
+async def handle_create_note(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
     title = params.get("title", "Untitled")
     content = params.get("content", "")
     try:
-        page = notion.create_page(title=title, content=content)
+        page = await notion.create_page(title=title, content=content)
         return f"Created note **{title}**\n{page.get('url', '')}"
     except Exception as e:
         return f"Failed to create note: {e}"
 
 
-def handle_append_note(ctx: Context, params: dict) -> str:
+async def handle_append_note(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
@@ -187,14 +388,14 @@ def handle_append_note(ctx: Context, params: dict) -> str:
     text = params.get("text", "")
     if not title or not text:
         return "I need both a note title and the text to append."
-    notes = notion.search_notes(query=title, limit=1)
-    if not notes:
-        return f"Couldn't find a note titled \"{title}\"."
-    notion.append_to_page(notes[0]["id"], text)
-    return f"Added text to **{notes[0]['title']}**."
+    note, err = await _find_note(title)
+    if err:
+        return err
+    await notion.append_to_page(note["id"], text)
+    return f"Added text to **{note['title']}**."
 
 
-def handle_add_todo(ctx: Context, params: dict) -> str:
+async def handle_add_todo(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
@@ -202,51 +403,96 @@ def handle_add_todo(ctx: Context, params: dict) -> str:
     task = params.get("task", "")
     if not title or not task:
         return "I need both a note title and the task text."
-    notes = notion.search_notes(query=title, limit=1)
-    if not notes:
-        return f"Couldn't find a note titled \"{title}\"."
-    notion.append_todo(notes[0]["id"], task)
-    return f"Added to-do \"**{task}**\" to **{notes[0]['title']}**."
+    note, err = await _find_note(title)
+    if err:
+        return err
+    await notion.append_todo(note["id"], task)
+    return f"Added to-do \"**{task}**\" to **{note['title']}**."
 
 
-def handle_archive_note(ctx: Context, params: dict) -> str:
+async def handle_archive_note(ctx: Context, params: dict) -> str:
     err = _ensure_notion()
     if err:
         return err
     title = params.get("title", "")
     if not title:
         return "I need the title of the note to archive."
-    notes = notion.search_notes(query=title, limit=1)
-    if not notes:
-        return f"Couldn't find a note titled \"{title}\"."
-    notion.archive_page(notes[0]["id"])
-    return f"Archived **{notes[0]['title']}**."
+    # Archiving is destructive: only act on a single title match, never a guess
+    note, err = await _find_note(title, destructive=True)
+    if err:
+        return err
+    await notion.archive_page(note["id"])
+    return f"Archived **{note['title']}**."
+
+
+# Streamed answers are flushed to the user roughly every 100 tokens
+STREAM_FLUSH_CHARS = 400
+STREAM_CUT_OFF_NOTICE = "(The answer was cut off, please retry.)"
 
+# Sender of the message being handled, so streamed replies know where to go
+_reply_to: ContextVar[str | None] = ContextVar("_reply_to", default=None)
 
-def handle_general_query(user_text: str) -> str:
-    """Fall back to ASI:1 for general questions."""
+
+async def _send_text(ctx: Context, sender: str, text: str, end_session: bool = False):
+    content = [TextContent(type="text", text=text)] if text else []
+    if end_session:
+        content.append(EndSessionContent(type="end-session"))
+    await ctx.send(
+        sender,
+        ChatMessage(timestamp=datetime.now(timezone.utc), msg_id=uuid4(), content=content),
+    )
+
+
+async def handle_general_query(ctx: Context, user_text: str) -> str:
+    """Fall back to ASI:1 for general questions.
+
+    The answer is streamed: completed chunks are sent to the user as they arrive
+    and the unsent remainder is returned for the final message.
+    """
+    sender = _reply_to.get()
+    buffer = ""
+    streamed = False
     try:
-        r = requests.post(
+        async with _asi1_client.stream(
+            "POST",
             ASI1_URL,
             headers=_asi1_headers(),
-            json={
+            content=orjson.dumps({
                 "model": "asi1",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a helpful Notion notes assistant. "
-                            "Answer the user's question concisely."
-                        ),
-                    },
-                    {"role": "user", "content": user_text},
-                ],
+                "messages": [_GENERAL_SYSTEM_MSG, {"role": "user", "content": user_text}],
                 "max_tokens": 1024,
-            },
-        )
-        return r.json()["choices"][0]["message"]["content"].strip()
-    except Exception:
+                "stream": True,
+            }),
+        ) as r:
+            # Error bodies (401/429/5xx) carry no data: lines, so fail loudly here
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                # Trailing chunks (e.g. usage) may come with an empty choices list
+                choices = orjson.loads(data).get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                buffer += delta
+                # Flush up to the last whitespace so words aren't split across messages
+                cut = max(buffer.rfind("\n"), buffer.rfind(" "))
+                if sender and len(buffer) >= STREAM_FLUSH_CHARS and cut > 0:
+                    await _send_text(ctx, sender, buffer[:cut].strip())
+                    buffer = buffer[cut:]
+                    streamed = True
+    except Exception as e:
+        ctx.logger.error(f"General query stream failed: {e}")
+        if not streamed and not buffer.strip():
+            return "Sorry, I wasn't able to process that."
+        # Keep what already arrived but make clear the answer is incomplete
+        return (buffer.strip() + "\n\n" + STREAM_CUT_OFF_NOTICE).strip()
+    if not streamed and not buffer.strip():
         return "Sorry, I wasn't able to process that."
+    return buffer.strip()
 
 
 def _format_notes(notes: list[dict]) -> str:
@@ -270,7 +516,7 @@ INTENT_HANDLERS = {
     "append_note": lambda ctx, p, t: handle_append_note(ctx, p),
     "add_todo": lambda ctx, p, t: handle_add_todo(ctx, p),
     "archive_note": lambda ctx, p, t: handle_archive_note(ctx, p),
-    "general_query": lambda ctx, p, t: handle_general_query(t),
+    "general_query": lambda ctx, p, t: handle_general_query(ctx, t),
 }
 
 
@@ -291,28 +537,25 @@ async def handle_message(ctx: Context, sender: str, msg: ChatMessage):
     if not text.strip():
         response_text = "I didn't receive any text. Please send me a message!"
     else:
-        # Classify intent via ASI:1
-        result = classify_intent(text)
-        intent = result.get("intent", "general_query")
-        params = result.get("params", {})
+        # Most intents start from the page list, so fetch it while ASI:1 classifies
+        token = _prefetched_pages.set(_prefetch_pages())
+        reply_token = _reply_to.set(sender)
+        try:
+            # Classify intent locally when possible, otherwise via ASI:1
+            result = _fast_classify(text) or await classify_intent(text)
+            intent = result.get("intent", "general_query")
+            params = result.get("params", {})
 
-        ctx.logger.info(f"Intent: {intent} | Params: {params}")
+            ctx.logger.info(f"Intent: {intent} | Params: {params}")
 
-        handler = INTENT_HANDLERS.get(intent, INTENT_HANDLERS["general_query"])
-        response_text = handler(ctx, params, text)
+            handler = INTENT_HANDLERS.get(intent, INTENT_HANDLERS["general_query"])
+            response_text = await handler(ctx, params, text)
+        finally:
+            _reply_to.reset(reply_token)
+            _prefetched_pages.reset(token)
 
-    # Send response
-    await ctx.send(
-        sender,
-        ChatMessage(
-            timestamp=datetime.now(timezone.utc),
-            msg_id=uuid4(),
-            content=[
-                TextContent(type="text", text=response_text),
-                EndSessionContent(type="end-session"),
-            ],
-        ),
-    )
+    # Send response (for streamed answers, just the remaining text)
+    await _send_text(ctx, sender, response_text, end_session=True)
 
 
 @protocol.on_message(ChatAcknowledgement)
@@ -354,8 +597,10 @@ async def startup_handler(ctx: Context):
     err = _ensure_notion()
     if err:
         ctx.logger.warning(f"Notion not connected on startup: {err}")
-    else:
+    elif await notion.test_connection():
         ctx.logger.info("Notion connection verified")
+    else:
+        ctx.logger.warning("Notion API key was rejected or Notion is unreachable")
 
     # Register with Agentverse
     if AGENTVERSE_KEY and SEED_PHRASE:
@@ -377,5 +622,15 @@ async def startup_handler(ctx: Context):
     else:
         ctx.logger.warning("AGENTVERSE_KEY or SEED_PHRASE not set, skipping Agentverse registration")
 
+
+@agent.on_event("shutdown")
+async def shutdown_handler(ctx: Context):
+    """Persist the semantic intent cache so paraphrase hits survive restarts."""
+    try:
+        semantic_intent_cache.save()
+    except Exception as e:
+        ctx.logger.error(f"Failed to save semantic intent cache: {e}")
+    await _asi1_client.aclose()
+
 if __name__ == "__main__":
     agent.run()
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""Semantic cache for intent classification — reuses results for paraphrased messages."""
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from .notion_client_wrapper import EMBEDDING_DIM, get_embedding
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticIntentCache:
+    """Nearest-neighbour cache of {intent, params} dicts keyed by query embeddings.
+
+    Callers should only store results that are valid for any similar message
+    (no message-specific params such as titles or task text).
+
+    Embeddings are stored L2-normalised in one (N, 1536) float32 matrix so a
+    lookup is a single matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        version: str = "",
+        threshold: float = 0.92,
+        max_entries: int = 500,
+    ):
+        self.path = path
+        self.version = version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._emb_matrix: np.ndarray = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self._results: list[dict] = []
+        self._lock = threading.Lock()
+        self._load()
+
+    def embed(self, text: str) -> np.ndarray | None:
+        """Return the L2-normalised embedding for text, or None if embedding fails."""
+        try:
+            vec = np.asarray(get_embedding(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Semantic intent cache disabled for this message: {e}")
+            return None
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return None
+        return vec / norm
+
+    def lookup(self, vec: np.ndarray) -> dict | None:
+        """Return the cached result of the most similar query above the threshold."""
+        with self._lock:
+            if not self._results:
+                return None
+            sims = self._emb_matrix @ vec
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            return self._results[best]
+
+    def add(self, vec: np.ndarray, result: dict) -> None:
+        """Store a classification result, dropping the oldest entries past max_entries."""
+        with self._lock:
+            self._emb_matrix = np.vstack([self._emb_matrix, vec[np.newaxis, :]])[-self.max_entries:]
+            self._results = (self._results + [result])[-self.max_entries:]
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self) -> None:
+        """Write the cache to disk (no-op when no path is configured)."""
+        if not self.path:
+            return
+        with self._lock:
+            emb_matrix = self._emb_matrix
+            meta = json.dumps({"version": self.version, "results": self._results})
+        # Plain arrays + JSON only, so loading never unpickles anything
+        with open(self.path, "wb") as f:
+            np.savez(f, emb_matrix=emb_matrix, meta=np.array(meta))
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                emb_matrix = np.asarray(data["emb_matrix"], dtype=np.float32)
+                meta = json.loads(str(data["meta"]))
+        except Exception as e:
+            logger.warning(f"Could not load semantic intent cache from {self.path}: {e}")
+            return
+        if meta.get("version") != self.version:
+            logger.info("Semantic intent cache is from an older prompt version, ignoring it")
+            return
+        if emb_matrix.ndim != 2 or emb_matrix.shape != (len(meta["results"]), EMBEDDING_DIM):
+            logger.warning(f"Semantic intent cache at {self.path} is malformed, ignoring it")
+            return
+        self._emb_matrix = emb_matrix
+        self._results = list(meta["results"])
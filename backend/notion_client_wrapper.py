@@ -1,13 +1,37 @@
 """Thin wrapper around the Notion SDK — uses embedding-based semantic search."""
 
+import asyncio
 import logging
 import os
+import sqlite3
+import threading
+import time
 
-from notion_client import Client
+import numpy as np
+from notion_client import AsyncClient
 from openai import OpenAI
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_DIM = 1536
+
+# Initial number of rows in the title-embedding matrix (doubles when full)
+_INITIAL_CACHE_CAPACITY = 1024
+
+# Per-request Notion API timeout so a stalled call (e.g. at startup) can't hang the agent
+NOTION_TIMEOUT_MS = 5000
+
+# How long a fetched page list is reused before asking Notion again
+PAGES_TTL_SECONDS = 30
+
+# In between full re-syncs only pages edited since the last sync are fetched.
+# A full sync is still needed now and then to drop pages archived elsewhere.
+PAGES_FULL_SYNC_SECONDS = 600
+
+# Notion limits: blocks per create/append request and characters per text object
+_MAX_BLOCKS_PER_REQUEST = 100
+_MAX_TEXT_LENGTH = 2000
+
 # ---------------------------------------------------------------------------
 # Embedding helpers
 # ---------------------------------------------------------------------------
@@ -22,7 +46,7 @@ def _get_openai_client() -> OpenAI:
     return _embedding_client
 
 
-def _get_embedding(text: str) -> list[float]:
+def get_embedding(text: str) -> list[float]:
     """Return the embedding vector for a text string."""
     r = _get_openai_client().embeddings.create(
         model="text-embedding-3-small",
@@ -32,14 +56,64 @@ def _get_embedding(text: str) -> list[float]:
     return r.data[0].embedding
 
 
-def _cosine_similarity(a: list[float], b: list[float]) -> float:
-    """Compute cosine similarity between two vectors (no numpy needed)."""
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = sum(x * x for x in a) ** 0.5
-    norm_b = sum(x * x for x in b) ** 0.5
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot / (norm_a * norm_b)
+# OpenAI accepts at most 2048 inputs per embeddings request
+_EMBEDDING_BATCH_SIZE = 2048
+
+
+def _get_embeddings_batch(texts: list[str]) -> list[list[float]]:
+    """Return embedding vectors for many texts using as few requests as possible."""
+    embeddings: list[list[float]] = []
+    for start in range(0, len(texts), _EMBEDDING_BATCH_SIZE):
+        r = _get_openai_client().embeddings.create(
+            model="text-embedding-3-small",
+            input=texts[start:start + _EMBEDDING_BATCH_SIZE],
+            encoding_format="float",
+        )
+        embeddings.extend(d.embedding for d in r.data)
+    return embeddings
+
+
+def _normalize(vec: list[float]) -> np.ndarray:
+    """Return vec as an L2-normalised float32 array (zero vectors stay zero)."""
+    v = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+def _encode_vec(vec: np.ndarray) -> bytes:
+    """Pack a vector for the on-disk cache as a float32 scale plus int8 values.
+
+    Symmetric per-vector quantisation (vec ≈ q * scale) keeps the file at about a
+    quarter of its float32 size; cosine scores move by ~1e-3.
+    """
+    peak = float(np.abs(vec).max())
+    scale = peak / 127.0 if peak else 1.0
+    q = np.round(vec / scale).astype(np.int8)
+    return np.float32(scale).tobytes() + q.tobytes()
+
+
+def _decode_vec(blob: bytes) -> np.ndarray:
+    """Unpack a vector written by _encode_vec (or a legacy raw float32 blob)."""
+    if len(blob) == EMBEDDING_DIM * 4:
+        return np.frombuffer(blob, dtype=np.float32)
+    scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+    return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+
+
+def _paragraph_blocks(content: str) -> list[dict]:
+    """Split text on blank lines into paragraph blocks within Notion's text limit."""
+    blocks = []
+    for para in content.split("\n\n"):
+        para = para.strip()
+        for start in range(0, len(para), _MAX_TEXT_LENGTH):
+            blocks.append({
+                "object": "block",
+                "type": "paragraph",
+                "paragraph": {
+                    "rich_text": [{"type": "text", "text": {"content": para[start:start + _MAX_TEXT_LENGTH]}}]
+                },
+            })
+    return blocks
 
 
 class NotionNotes:
@@ -49,14 +123,36 @@ class NotionNotes:
         api_key = os.getenv("NOTION_API_KEY")
         if not api_key:
             raise ValueError("NOTION_API_KEY must be set in .env")
-        self.client = Client(auth=api_key)
-        # In-memory embedding cache: page_id -> (title, embedding)
-        self._cache: dict[str, tuple[str, list[float]]] = {}
-
-    def test_connection(self) -> bool:
-        """Verify the Notion API key works by running a simple search."""
+        self.client = AsyncClient(auth=api_key, timeout_ms=NOTION_TIMEOUT_MS)
+        # Set NOTION_SEMANTIC_SEARCH=0 to use Notion's own keyword search (no embeddings)
+        self.semantic_search = os.getenv("NOTION_SEMANTIC_SEARCH", "1") == "1"
+        # In-memory embedding cache, written through to SQLite so restarts don't
+        # re-embed every title. Stored column-wise: _cache_index maps a page id to
+        # row i, where _cache_vecs[i] is the L2-normalised embedding of _cache_titles[i].
+        # Kept as float32 in memory (NumPy only uses BLAS for float matmuls) and
+        # quantised to int8 on disk.
+        self._cache_titles: list[str] = []
+        self._cache_vecs = np.zeros((_INITIAL_CACHE_CAPACITY, EMBEDDING_DIM), dtype=np.float32)
+        self._cache_fill = 0
+        self._cache_free: list[int] = []
+        self._cache_index: dict[str, int] = {}
+        # Short-lived copy of the page list, see _fetch_all_pages
+        self._pages: list[dict] | None = None
+        self._pages_fetched_at = 0.0
+        self._pages_synced_at = 0.0
+        # Parent page for new notes, looked up once per process (see reset_root)
+        self._root_page_id: str | None = None
+        # The SQLite file is opened and loaded on first use, in a worker thread
+        # (see _load_cache); all DB I/O stays off the event loop
+        self._db_path = os.getenv("NOTION_EMB_CACHE_PATH", "notion_emb_cache.db")
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._db_load_lock = asyncio.Lock()
+
+    async def test_connection(self) -> bool:
+        """Verify the Notion API key works via the cheap bot-user endpoint."""
         try:
-            self.client.search(query="", page_size=1)
+            await self.client.users.me()
             return True
         except Exception:
             return False
@@ -65,13 +161,18 @@ class NotionNotes:
     # Semantic search
     # ------------------------------------------------------------------
 
-    def search_notes(self, query: str = "", limit: int = 10) -> list[dict]:
+    async def search_notes(self, query: str = "", limit: int = 10, pages: list[dict] | None = None) -> list[dict]:
         """Search pages semantically using embeddings.
 
         If query is empty, falls back to listing recent pages (no embedding needed).
+        Pass pages to reuse an already-fetched page list instead of querying Notion.
+        With semantic search disabled, non-empty queries go to Notion's keyword search.
         """
+        if query.strip() and not self.semantic_search:
+            return await self._keyword_search(query, limit)
+
         # Fetch all accessible pages from Notion
-        all_pages = self._fetch_all_pages()
+        all_pages = pages if pages is not None else await self._fetch_all_pages()
 
         if not all_pages:
             logger.info("No pages accessible in workspace")
@@ -81,45 +182,64 @@ class NotionNotes:
         if not query.strip():
             return all_pages[:limit]
 
-        # Embed the query
-        query_embedding = _get_embedding(query)
-
-        # Embed each page title (uses cache to avoid re-embedding)
-        scored = []
-        for page in all_pages:
-            page_id = page["id"]
-            title = page["title"]
-
-            if page_id in self._cache and self._cache[page_id][0] == title:
-                title_embedding = self._cache[page_id][1]
-            else:
-                title_embedding = _get_embedding(title)
-                self._cache[page_id] = (title, title_embedding)
-
-            score = _cosine_similarity(query_embedding, title_embedding)
-            scored.append((score, page))
-
-        # Sort by similarity (highest first) and return top results
-        scored.sort(key=lambda x: x[0], reverse=True)
-        results = [page for score, page in scored[:limit] if score > 0.3]
+        # Embed the query together with every uncached title in one batch
+        await self._load_cache()
+        missing = [page for page in all_pages if self._cached_title(page["id"]) != page["title"]]
+        embeddings = await asyncio.to_thread(
+            _get_embeddings_batch, [query] + [page["title"] for page in missing]
+        )
+        query_embedding = _normalize(embeddings[0])
+        for page, title_embedding in zip(missing, embeddings[1:]):
+            self._cache_put(page["id"], page["title"], title_embedding)
+        await self._store_embeddings(missing, embeddings[1:])
+
+        # Cosine similarity of this page list's titles in one matrix-vector product
+        # (free-list and stale rows are never scored)
+        rows = [self._cache_index[page["id"]] for page in all_pages]
+        scores = self._cache_vecs[rows] @ query_embedding
+
+        # Top-k without sorting every score, then order just that slice
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        results = [all_pages[i] for i in top if scores[i] > 0.3]
 
         logger.info(
             f"Semantic search query='{query}' matched {len(results)} of {len(all_pages)} pages "
-            f"(top score={scored[0][0]:.3f})"
+            f"(top score={scores.max():.3f})"
         )
         return results
 
-    def list_recent_notes(self, limit: int = 10) -> list[dict]:
+    async def find_by_title(self, title: str, pages: list[dict] | None = None) -> list[dict]:
+        """Find pages by case-insensitive title match without computing embeddings.
+
+        A page URL or id picks that page. Otherwise returns the exact title matches
+        if there are any (most recently edited first), else every page whose title
+        contains the text. More than one result means the title is ambiguous.
+        """
+        needle = title.strip().lower()
+        if not needle:
+            return []
+        all_pages = pages if pages is not None else await self._fetch_all_pages()
+        by_link = [p for p in all_pages if needle in (p["id"].lower(), p.get("url", "").lower())]
+        if by_link:
+            return by_link
+        exact = [p for p in all_pages if p["title"].lower() == needle]
+        return exact or [p for p in all_pages if needle in p["title"].lower()]
+
+    async def list_recent_notes(self, limit: int = 10, pages: list[dict] | None = None) -> list[dict]:
         """Return the most recently edited pages."""
-        return self.search_notes(query="", limit=limit)
+        return await self.search_notes(query="", limit=limit, pages=pages)
 
     # ------------------------------------------------------------------
     # Page operations
     # ------------------------------------------------------------------
 
-    def get_page_content(self, page_id: str) -> str:
+    async def get_page_content(self, page_id: str) -> str:
         """Retrieve the text content (blocks) of a single page."""
-        blocks = self.client.blocks.children.list(block_id=page_id, page_size=100)
+        blocks = await self.client.blocks.children.list(block_id=page_id, page_size=100)
         texts = []
         for block in blocks.get("results", []):
             btype = block.get("type", "")
@@ -130,31 +250,34 @@ class NotionNotes:
                     texts.append(plain)
         return "\n".join(texts)
 
-    def create_page(self, title: str, content: str = "") -> dict:
-        """Create a new page in the workspace (as a child of first accessible page)."""
-        children = []
-        if content:
-            children.append({
-                "object": "block",
-                "type": "paragraph",
-                "paragraph": {
-                    "rich_text": [{"type": "text", "text": {"content": content}}]
-                },
-            })
-        page = self.client.pages.create(
-            parent={"page_id": self._get_root_page_id()},
+    async def create_page(self, title: str, content: str = "") -> dict:
+        """Create a new page in the workspace (as a child of first accessible page).
+
+        Multi-paragraph content is sent with the create request itself; only
+        content beyond Notion's per-request block limit needs follow-up appends.
+        """
+        children = _paragraph_blocks(content) if content else []
+        page = await self.client.pages.create(
+            parent={"page_id": await self._get_root_page_id()},
             properties={
                 "title": [{"type": "text", "text": {"content": title}}]
             },
-            children=children,
+            children=children[:_MAX_BLOCKS_PER_REQUEST],
         )
-        # Invalidate cache so new page shows up in searches
-        self._cache.pop(page["id"], None)
+        # Appended in order: concurrent appends to one page don't preserve block order
+        for start in range(_MAX_BLOCKS_PER_REQUEST, len(children), _MAX_BLOCKS_PER_REQUEST):
+            await self.client.blocks.children.append(
+                block_id=page["id"],
+                children=children[start:start + _MAX_BLOCKS_PER_REQUEST],
+            )
+        # Invalidate caches so new page shows up in searches
+        await self._forget(page["id"])
+        self._pages = None
         return {"id": page["id"], "title": title, "url": page.get("url", "")}
 
-    def append_to_page(self, page_id: str, text: str) -> bool:
+    async def append_to_page(self, page_id: str, text: str) -> bool:
         """Append a paragraph block to an existing page."""
-        self.client.blocks.children.append(
+        await self.client.blocks.children.append(
             block_id=page_id,
             children=[{
                 "object": "block",
@@ -166,9 +289,9 @@ class NotionNotes:
         )
         return True
 
-    def append_todo(self, page_id: str, text: str, checked: bool = False) -> bool:
+    async def append_todo(self, page_id: str, text: str, checked: bool = False) -> bool:
         """Append a to-do checkbox block to an existing page."""
-        self.client.blocks.children.append(
+        await self.client.blocks.children.append(
             block_id=page_id,
             children=[{
                 "object": "block",
@@ -181,29 +304,181 @@ class NotionNotes:
         )
         return True
 
-    def archive_page(self, page_id: str) -> bool:
+    async def archive_page(self, page_id: str) -> bool:
         """Archive (soft-delete) a page."""
-        self.client.pages.update(page_id=page_id, archived=True)
-        self._cache.pop(page_id, None)
+        await self.client.pages.update(page_id=page_id, archived=True)
+        await self._forget(page_id)
+        self._pages = None
+        if page_id == self._root_page_id:
+            self.reset_root()
         return True
 
+    def reset_root(self) -> None:
+        """Forget the cached parent page so the next create_page looks it up again."""
+        self._root_page_id = None
+
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
 
-    def _fetch_all_pages(self) -> list[dict]:
-        """Fetch all accessible pages from Notion (up to 100)."""
-        result = self.client.search(
-            query="",
+    def _open_db(self) -> tuple[sqlite3.Connection, list[tuple[str, str, np.ndarray]]]:
+        """Open the on-disk embedding cache and read every stored row (blocking)."""
+        db = sqlite3.connect(self._db_path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS emb("
+            "page_id TEXT PRIMARY KEY, title TEXT, last_edited TEXT, vec BLOB)"
+        )
+        db.commit()
+        rows = [
+            (page_id, title, _decode_vec(vec))
+            for page_id, title, vec in db.execute("SELECT page_id, title, vec FROM emb")
+        ]
+        return db, rows
+
+    async def _load_cache(self) -> None:
+        """Load the on-disk embedding cache into memory once, off the event loop."""
+        if self._db is not None:
+            return
+        async with self._db_load_lock:
+            if self._db is not None:
+                return
+            db, rows = await asyncio.to_thread(self._open_db)
+            for page_id, title, vec in rows:
+                self._cache_put(page_id, title, vec)
+            self._db = db
+
+    def _db_write(self, sql: str, rows: list[tuple]) -> None:
+        """Run a write statement for each row and commit (blocking; use via to_thread)."""
+        with self._db_lock:
+            self._db.executemany(sql, rows)
+            self._db.commit()
+
+    async def _store_embeddings(self, pages: list[dict], embeddings: list[list[float]]) -> None:
+        """Write page embeddings through to the on-disk cache (int8-quantised)."""
+        if not pages:
+            return
+        rows = [
+            (p["id"], p["title"], p.get("last_edited", ""), _encode_vec(_normalize(e)))
+            for p, e in zip(pages, embeddings)
+        ]
+        await asyncio.to_thread(
+            self._db_write,
+            "INSERT OR REPLACE INTO emb(page_id, title, last_edited, vec) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+
+    def _cached_title(self, page_id: str) -> str | None:
+        """Return the title whose embedding is cached for page_id, if any."""
+        row = self._cache_index.get(page_id)
+        return None if row is None else self._cache_titles[row]
+
+    def _cache_put(self, page_id: str, title: str, embedding) -> None:
+        """Store a title embedding, normalised once here so searches skip norm work."""
+        row = self._cache_index.get(page_id)
+        if row is None:
+            if self._cache_free:
+                row = self._cache_free.pop()
+            else:
+                if self._cache_fill == len(self._cache_vecs):
+                    grown = np.zeros((2 * len(self._cache_vecs), EMBEDDING_DIM), dtype=np.float32)
+                    grown[:self._cache_fill] = self._cache_vecs[:self._cache_fill]
+                    self._cache_vecs = grown
+                row = self._cache_fill
+                self._cache_fill += 1
+                self._cache_titles.append("")
+            self._cache_index[page_id] = row
+        self._cache_titles[row] = title
+        self._cache_vecs[row] = _normalize(embedding)
+
+    def _cache_drop(self, page_id: str) -> None:
+        """Remove a page from the in-memory cache, freeing its row for reuse."""
+        row = self._cache_index.pop(page_id, None)
+        if row is not None:
+            self._cache_titles[row] = ""
+            self._cache_free.append(row)
+
+    async def _forget(self, page_id: str) -> None:
+        """Drop a page from the in-memory and on-disk embedding caches."""
+        await self._load_cache()
+        self._cache_drop(page_id)
+        await asyncio.to_thread(self._db_write, "DELETE FROM emb WHERE page_id = ?", [(page_id,)])
+
+    async def _prune_cache(self, live_ids: set[str]) -> None:
+        """Drop cached embeddings of pages that are no longer in the workspace."""
+        await self._load_cache()
+        stale = [page_id for page_id in self._cache_index if page_id not in live_ids]
+        if not stale:
+            return
+        for page_id in stale:
+            self._cache_drop(page_id)
+        await asyncio.to_thread(
+            self._db_write, "DELETE FROM emb WHERE page_id = ?", [(page_id,) for page_id in stale]
+        )
+        logger.info(f"Pruned {len(stale)} embeddings of deleted or archived pages")
+
+    async def _fetch_all_pages(self) -> list[dict]:
+        """Fetch all accessible pages from Notion, most recently edited first.
+
+        The result is reused for PAGES_TTL_SECONDS since the Notion search is the slow part;
+        after that only pages edited since the previous fetch are requested and merged in.
+        """
+        now = time.monotonic()
+        if self._pages is not None and now - self._pages_fetched_at < PAGES_TTL_SECONDS:
+            return self._pages
+        if self._pages and now - self._pages_synced_at < PAGES_FULL_SYNC_SECONDS:
+            # last_edited_time is minute-granular, so re-fetch the newest minute too
+            changed = await self._search_pages(edited_since=self._pages[0]["last_edited"])
+            changed_ids = {p["id"] for p in changed}
+            pages = changed + [p for p in self._pages if p["id"] not in changed_ids]
+        else:
+            pages = await self._search_pages()
+            self._pages_synced_at = now
+            await self._prune_cache({p["id"] for p in pages})
+        self._pages = pages
+        self._pages_fetched_at = now
+        return self._pages
+
+    async def _keyword_search(self, query: str, limit: int) -> list[dict]:
+        """Search page titles with the Notion API's keyword search."""
+        result = await self.client.search(
+            query=query,
             filter={"value": "page", "property": "object"},
-            sort={"direction": "descending", "timestamp": "last_edited_time"},
-            page_size=100,
+            page_size=min(max(limit, 1), 100),
         )
-        return self._extract_pages(result)
+        return self._extract_pages(result)[:limit]
+
+    async def _search_pages(self, edited_since: str | None = None) -> list[dict]:
+        """Page through the Notion search API, optionally stopping at older pages."""
+        pages: list[dict] = []
+        cursor = None
+        while True:
+            kwargs = {"start_cursor": cursor} if cursor else {}
+            result = await self.client.search(
+                query="",
+                filter={"value": "page", "property": "object"},
+                sort={"direction": "descending", "timestamp": "last_edited_time"},
+                page_size=100,
+                **kwargs,
+            )
+            batch = self._extract_pages(result)
+            if edited_since is not None:
+                # Results are sorted newest first; ISO timestamps compare as strings
+                newer = [p for p in batch if p["last_edited"] >= edited_since]
+                pages.extend(newer)
+                if len(newer) < len(batch):
+                    break
+            else:
+                pages.extend(batch)
+            cursor = result.get("next_cursor")
+            if not result.get("has_more") or not cursor:
+                break
+        return pages
 
-    def _get_root_page_id(self) -> str:
-        """Get the first accessible page to use as a parent for new pages."""
-        result = self.client.search(
+    async def _get_root_page_id(self) -> str:
+        """Get the first accessible page to use as a parent for new pages (cached)."""
+        if self._root_page_id is not None:
+            return self._root_page_id
+        result = await self.client.search(
             query="",
             filter={"value": "page", "property": "object"},
             page_size=1,
@@ -211,28 +486,28 @@ class NotionNotes:
         pages = result.get("results", [])
         if not pages:
             raise ValueError("No accessible pages found to use as parent.")
-        return pages[0]["id"]
+        self._root_page_id = pages[0]["id"]
+        return self._root_page_id
+
+    @staticmethod
+    def _extract_title(page: dict) -> str:
+        """Return the plain-text title of a Notion page object."""
+        props = page.get("properties", {})
+        title_prop = next((p for p in props.values() if p.get("type") == "title"), None)
+        if not title_prop or not title_prop.get("title"):
+            return "(untitled)"
+        return title_prop["title"][0].get("plain_text", "(untitled)")
 
     @staticmethod
     def _extract_pages(search_result: dict) -> list[dict]:
         """Flatten Notion page objects into simple dicts."""
-        pages = []
-        for page in search_result.get("results", []):
-            props = page.get("properties", {})
-
-            title = "(untitled)"
-            for prop in props.values():
-                if prop.get("type") == "title":
-                    parts = prop.get("title", [])
-                    if parts:
-                        title = parts[0].get("plain_text", "(untitled)")
-                    break
-
-            pages.append({
+        return [
+            {
                 "id": page["id"],
-                "title": title,
+                "title": NotionNotes._extract_title(page),
                 "url": page.get("url", ""),
                 "last_edited": page.get("last_edited_time", ""),
                 "created": page.get("created_time", ""),
-            })
-        return pages
+            }
+            for page in search_result.get("results", [])
+        ]